@@ -1,5 +1,6 @@
 import re
-from datetime import datetime, timedelta, time
+import enum
+from datetime import date, datetime, timedelta, time
 import holidays
 import gspread
 from aiogram import Bot, Dispatcher, types, F
@@ -7,17 +8,41 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.client.default import DefaultBotProperties
-from aiogram.filters import Command
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.base import BaseSession
+from aiogram.filters import Command, CommandObject
 from oauth2client.service_account import ServiceAccountCredentials
 import asyncio
 import pytz
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # без pyarrow история выгружается только в CSV
+    pyarrow = None
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 import logging
 import os
 import sys
+import threading
+import traceback
+import collections
+import heapq
+import random
+import requests
+import csv
+import shutil
+import argparse
+import json
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep as blocking_sleep
 
-RU_HOLIDAYS = holidays.RU(years=[2025,2026,2027])
+MSK_TZ = pytz.timezone("Europe/Moscow")
+WORKDAY_START = time(9, 0)
+WORKDAY_END = time(23, 0)
+CALENDAR_HORIZON_DAYS = 400  # на сколько дней вперёд рассчитываются рабочие интервалы
 
 def setup_logging():
     log_format = "[%(asctime)s] %(levelname)s %(name)s: %(message)s"
@@ -45,9 +70,62 @@ def log_event(event_type: str, user_data: dict = None, details: str = ""):
     org_info = ""
     if user_data:
         org_info = f" | Организация: {user_data.get('org', 'N/A')} ({user_data.get('name', 'N/A')})"
-    logger.info(f"{event_type}{org_info} | {details}")
+    desk = current_tenant.get(None)
+    desk_info = f"[{desk.name}] " if desk and len(tenants) > 1 else ""
+    logger.info(f"{desk_info}{event_type}{org_info} | {details}")
 
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+#  Часы
+# Все отсчёты времени бизнес-логики (сроки ответа, расписание, рабочие часы) идут
+# через clock. В режиме симуляции его заменяет VirtualClock, и день проигрывается за секунды.
+class Clock:
+    def now(self, tz=None) -> datetime:
+        return datetime.now(tz)
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+class VirtualClock(Clock):
+    # Время стоит на месте, пока его не передвинут advance_to(); ожидания sleep()
+    # срабатывают строго в порядке сроков, поэтому результат прогона детерминирован
+    def __init__(self, start: datetime):
+        self.current = start  # местное время МСК без часового пояса, как datetime.now()
+        self.sleepers = []
+        self.counter = 0
+
+    def now(self, tz=None) -> datetime:
+        if tz is None:
+            return self.current
+        return MSK_TZ.localize(self.current).astimezone(tz)
+
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.counter += 1
+        heapq.heappush(self.sleepers, (self.current + timedelta(seconds=seconds), self.counter, waiter))
+        await waiter
+
+    async def settle(self):
+        # Даёт разбуженным задачам доработать до следующего ожидания
+        for _ in range(SIMULATION_SETTLE_STEPS):
+            await asyncio.sleep(0)
+
+    async def advance_to(self, moment: datetime):
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(MSK_TZ).replace(tzinfo=None)
+        while self.sleepers and self.sleepers[0][0] <= moment:
+            deadline, _, waiter = heapq.heappop(self.sleepers)
+            if waiter.done():
+                continue
+            self.current = max(self.current, deadline)
+            waiter.set_result(None)
+            await self.settle()
+        self.current = max(self.current, moment)
+
+clock = Clock()
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 
 def get_main_inline_kb(offers_allowed=True):
     kb = []
@@ -104,41 +182,759 @@ def get_yes_no_inline_kb():
     )
  
 
-def offers_today_count(user_id, metal):# Возвращает количество предложений пользователя по металлу на сегодня
+#  Типизированное чтение листов
+# Строки листа декодируются за один проход по get_all_values(): индексы столбцов
+# вычисляются один раз по заголовку, значения сразу приводятся к нужным типам.
+class NotificationType(enum.Enum):
+    TEXT = "текст"
+    QUOTE = "запрос котировок"
+
+def parse_text(value: str) -> str:
+    return value.strip()
+
+def parse_int(value: str):
+    try:
+        return int(value.strip())
+    except ValueError:
+        return None
+
+def parse_date(value: str):
+    try:
+        return datetime.strptime(value.split()[0], "%d.%m.%Y").date()
+    except (ValueError, IndexError):
+        return None
+
+def parse_hhmm(value: str):
+    try:
+        return datetime.strptime(value.strip(), "%H:%M").time()
+    except ValueError:
+        return None
 
-    today = datetime.now().date()
-    all_offers = offers_sheet.get_all_records()
+def parse_flag(value: str) -> bool:
+    return value.strip().lower() == "да"
+
+def parse_segments(value: str) -> tuple:
+    # "Банк РФ; Организация в РФ" -> ("Банк РФ", "Организация в РФ"); пусто — все пользователи
+    return tuple(segment.strip() for segment in re.split(r"[;,]", value) if segment.strip())
+
+def parse_notification_type(value: str) -> NotificationType:
+    if value.strip().lower() == NotificationType.TEXT.value:
+        return NotificationType.TEXT
+    return NotificationType.QUOTE
+
+class SheetRecord:
+    __slots__ = ()
+    columns = ()  # (заголовок, парсер, обязательный) в порядке __slots__
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+class UserRecord(SheetRecord):
+    __slots__ = ("user_id", "name", "org", "contacts", "org_type", "notify")
+    columns = (
+        ("ID Telegram", parse_int, True),
+        ("Имя", parse_text, True),
+        ("Организация", parse_text, True),
+        ("Контакты", parse_text, False),
+        ("Тип организации", parse_text, True),
+        ("Отправка уведомления", parse_flag, False),
+    )
+
+    def as_user_data(self) -> dict:
+        return {"name": self.name, "org": self.org, "org_type": self.org_type}
+
+class OfferRecord(SheetRecord):
+    __slots__ = ("user_id", "date", "metal")
+    columns = (
+        ("ID Telegram", parse_int, True),
+        ("Дата", parse_date, True),
+        ("Металл", parse_text, True),
+    )
+
+class RequestRecord(SheetRecord):
+    __slots__ = ("send_time", "kind", "text", "response_time", "segments")
+    columns = (
+        ("Время отправки, МСК", parse_hhmm, True),
+        ("Тип уведомления", parse_notification_type, False),
+        ("Текст запроса", parse_text, True),
+        ("Время ответа", parse_int, False),
+        ("Сегмент", parse_segments, False),
+    )
+
+class SettingRecord(SheetRecord):
+    __slots__ = ("name", "value")
+    columns = (
+        ("Настройка", parse_text, True),
+        ("Признак", parse_text, True),
+    )
+
+def decode_rows(values: list, record_cls) -> list:
+    if not values:
+        return []
+    header = [title.strip() for title in values[0]]
+    getters = []
+    for title, parse, required in record_cls.columns:
+        if title in header:
+            getters.append((header.index(title), parse))
+        elif required:
+            raise ValueError(f"Столбец '{title}' не найден в заголовках: {header}")
+        else:
+            getters.append((None, parse))
+    records = []
+    for row in values[1:]:
+        width = len(row)
+        records.append(record_cls(*[
+            parse(row[index] if index is not None and index < width else "")
+            for index, parse in getters
+        ]))
+    return records
+
+async def offers_today_count(user_id, metal):# Возвращает количество предложений пользователя по металлу на сегодня
+    today = clock.now().date()
     count = 0
-    for row in all_offers:
-        try:
-            if str(row.get("ID Telegram", "")) == str(user_id) and row.get("Металл", "") == metal:
-                date_str = str(row.get("Дата", "")).strip()  
-                if date_str:
-                    row_date = datetime.strptime(date_str.split()[0], "%d.%m.%Y").date()
-                    if row_date == today:
-                        count += 1 # Не больше 2 предожений в день по 1 металлу
-        except Exception:
-            continue
+    for offer in await read_offers(today, today):
+        if offer.user_id == user_id and offer.metal == metal:
+            count += 1 # Не больше 2 предожений в день по 1 металлу
     return count
 
 TOKEN = "_________________"
 GOOGLE_SHEET_NAME = "_______"
 CREDENTIALS_FILE = "credentials.json"
 SHEET_NAME = "Пользователи"
+# Лист предложений хранит только текущий день, прошлые дни переносятся
+# в архивные листы по месяцам: "Предложения о покупке ГГГГ-ММ"
+OFFERS_SHEET_NAME = "Предложения о покупке"
 chat_id = '-4787764944'
-active_timers = {}
+TENANTS_FILE = "tenants.json"  # конфигурация нескольких ботов, см. load_tenant_configs()
+SHEETS_QUOTA_PER_MINUTE = 250  # запросов к Google Sheets в минуту на весь процесс
+CHANGES_POLL_SECONDS = 30  # период проверки изменений таблицы
+SHEETS_RETRIES = 3  # повторов при 429/5xx и сетевых ошибках
+SHEETS_BACKOFF_BASE = 0.5  # базовая задержка повтора, сек (удваивается, со случайным разбросом)
+SHEETS_BACKOFF_CAP = 4
+BREAKER_FAILURE_THRESHOLD = 3  # неудачных обращений подряд до отключения листа
+BREAKER_RESET_SECONDS = 60
+WRITES_FLUSH_SECONDS = 30  # период дозаписи отложенных строк
+LAG_PROBE_INTERVAL = 0.5  # период замера задержки event loop, сек
+LAG_THRESHOLD = 1.0  # блокировка event loop дольше этого времени логируется со стеком
+LAG_SAMPLES = 1200  # замеров для перцентилей (10 минут)
+HEALTH_HOST = "127.0.0.1"  # ответы содержат метрики, наружу открывать только осознанно
+HEALTH_PORT = 8080  # порт для /health/live и /health/ready, 0 — не запускать
+READY_MAX_LAG = 2.0  # p95 задержки, при котором бот считается неготовым, сек
+LIVE_MAX_STALL = 60  # блокировка, при которой бот считается зависшим, сек
+EXPORT_DIR = "export"
+EXPORT_CHUNK_ROWS = 2000  # строк за один запрос при выгрузке истории
+# Выгрузка запускается отдельным процессом со своим ограничителем и не видит запросов бота,
+# поэтому ей отведена доля квоты: вместе с SHEETS_QUOTA_PER_MINUTE — 300 запросов в минуту
+EXPORT_SHEETS_QUOTA_PER_MINUTE = 50
+SIMULATION_SETTLE_STEPS = 50  # проходов event loop после каждого шага виртуального времени
+VIEW_MAX_AGE = 10 * 60  # кэш листа перечитывается не реже, сек
+MAX_CONCURRENT_HANDLERS = 20  # одновременно выполняемых обработчиков на весь процесс
+MAX_USER_QUEUE = 3  # обновлений одного пользователя в обработке и в очереди
+MAX_PENDING_UPDATES = 300  # всего обновлений в обработке и в очереди
+BUSY_TEXT = "⏳ Бот сейчас перегружен, повторите, пожалуйста, через минуту."
+RECENT_UPDATES_SIZE = 10000  # запоминаемых update_id для отсева повторной доставки
+RECENT_UPDATES_TTL = 10 * 60
+RECENT_CALLBACKS_SIZE = 5000  # запоминаемых нажатий кнопок для отсева двойных нажатий
+RECENT_CALLBACKS_TTL = 30
 MAX_MESSAGE_AGE = timedelta(minutes=2)
 NOTIFICATION_COLUMN = 7
+ADMIN_IDS = []  # ID Telegram администраторов, которым доступны служебные команды
+PROFILE_DIR = "profiles"
+PROFILE_INTERVAL = 0.005  # период снятия стека при профилировании, сек
+PROFILE_MAX_SECONDS = 600
+PROFILE_SEND_TO_CHAT = True  # отправлять ли профиль администратору в чат
+profile_stop_event = None
+
+#  Общая среда выполнения для нескольких ботов
+# Каждый бот (отдельный стол) обслуживается своим токеном, таблицей и группой.
+# HTTP-сессия, клиент Google Sheets, ограничитель квоты и планировщик общие,
+# а FSM, настройки и кэши у каждого бота свои.
+class SheetsQuota:
+    # Общий для всех ботов ограничитель запросов к Google Sheets (скользящее окно в минуту).
+    # acquire() ждёт, блокируя поток, поэтому вызывается только из рабочих потоков
+    # (см. run_sheets) или до запуска event loop.
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.calls = collections.deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.per_minute is None:
+            return
+        while True:
+            with self.lock:
+                now = monotonic()
+                while self.calls and now - self.calls[0] >= 60:
+                    self.calls.popleft()
+                if len(self.calls) < self.per_minute:
+                    self.calls.append(now)
+                    return
+                wait = 60 - (now - self.calls[0])
+            logger.warning(f"Квота Google Sheets исчерпана, ожидание {wait:.1f} сек")
+            blocking_sleep(wait)
+
+class SheetsUnavailable(Exception):
+    pass
+
+def is_retryable(error: Exception) -> bool:
+    # 429 и 5xx от Google, а также сетевые сбои — временные, их имеет смысл повторить
+    if isinstance(error, gspread.exceptions.APIError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def is_rate_limited(error: Exception) -> bool:
+    # 429: Google отклонил запрос, не выполняя его
+    return isinstance(error, gspread.exceptions.APIError) and error.response.status_code == 429
+
+def is_ambiguous(error: Exception) -> bool:
+    # Таймаут, обрыв соединения или 5xx: запрос мог дойти до Google и выполниться
+    return is_retryable(error) and not is_rate_limited(error)
+
+def is_unavailable(error: Exception) -> bool:
+    return isinstance(error, SheetsUnavailable) or is_retryable(error)
+
+def same_row(sheet_row: list, values: list) -> bool:
+    # Сравнивает строку, прочитанную из листа, с записанными значениями: пустые ячейки
+    # в конце не учитываются, лист в памяти (симуляция) хранит значения строками
+    for index in range(max(len(sheet_row), len(values))):
+        cell = sheet_row[index] if index < len(sheet_row) else ""
+        value = values[index] if index < len(values) else ""
+        if value is None:
+            value = ""
+        if cell != value and str(cell) != str(value):
+            return False
+    return True
+
+class CircuitBreaker:
+    # После нескольких неудачных обращений подряд лист считается недоступным
+    # на BREAKER_RESET_SECONDS, затем пропускается ровно одна пробная попытка:
+    # остальные обращения получают отказ, пока проба не завершится.
+    # Обращения идут из нескольких рабочих потоков, поэтому состояние меняется под блокировкой.
+    __slots__ = ("title", "state", "failures", "opened_at", "probing", "lock")
+
+    def __init__(self, title: str):
+        self.title = title
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        # Разрешает обращение; в состоянии half_open — только первому, он и становится пробой
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and monotonic() - self.opened_at >= BREAKER_RESET_SECONDS:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def is_blocked(self) -> bool:
+        # Проверка без захвата пробы, для решения, стоит ли вообще начинать обращения
+        with self.lock:
+            if self.state == "open":
+                return monotonic() - self.opened_at < BREAKER_RESET_SECONDS
+            return self.state == "half_open" and self.probing
+
+    def record_success(self):
+        with self.lock:
+            if self.state != "closed":
+                logger.info(f"Лист '{self.title}' снова доступен")
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= BREAKER_FAILURE_THRESHOLD:
+                if self.state != "open":
+                    logger.warning(f"Лист '{self.title}' недоступен, обращения приостановлены на {BREAKER_RESET_SECONDS} сек")
+                self.state = "open"
+                self.opened_at = monotonic()
+            self.probing = False
+
+sheets_in_threads = True  # в симуляции листы в памяти, и вызовы выполняются сразу
+
+async def run_sheets(func, *args, **kwargs):
+    # Запросы к Google Sheets выполняются в рабочем потоке: сетевой вызов, ожидание
+    # квоты и повторы с задержкой не блокируют event loop
+    if not sheets_in_threads:
+        return func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+class GovernedSheet:
+    # Лист Google Sheets, все запросы к которому проходят через общий ограничитель квоты.
+    # Временные ошибки повторяются с экспоненциальной задержкой, при недоступности листа
+    # чтение отдаёт последние полученные данные, а дописывание строк ставится в очередь.
+    # Публичные методы асинхронные, сами запросы выполняются в рабочем потоке.
+    READ_METHODS = ("get_all_values", "get_values")
+
+    def __init__(self, worksheet, before_write=None, on_write=None):
+        self.worksheet = worksheet
+        self.title = worksheet.title
+        self.before_write = before_write
+        self.on_write = on_write
+        self.breaker = CircuitBreaker(worksheet.title)
+        self.last_good = {}
+        self.pending_writes = collections.deque()
+        self.write_lock = threading.Lock()  # дописывание и дозапись очереди идут строго по одной
+        self.retries = 0
+        self.degraded_reads = 0
+
+    def _call(self, method: str, *args, **kwargs):
+        if not self.breaker.allow():
+            raise SheetsUnavailable(f"Лист '{self.title}' временно недоступен")
+        # Чтение повторяется при любой временной ошибке, запись и удаление — только после 429:
+        # после таймаута или 5xx запрос мог выполниться, и повтор задвоил бы или удалил лишние строки
+        can_retry = is_retryable if method in self.READ_METHODS else is_rate_limited
+        for attempt in range(SHEETS_RETRIES + 1):
+            sheets_quota.acquire()
+            try:
+                result = getattr(self.worksheet, method)(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # Ошибка не из-за недоступности листа (например, 400): проба завершена
+                    self.breaker.record_success()
+                    raise
+                if attempt == SHEETS_RETRIES or not can_retry(e):
+                    self.breaker.record_failure()
+                    raise
+                self.retries += 1
+                delay = random.uniform(0, min(SHEETS_BACKOFF_CAP, SHEETS_BACKOFF_BASE * 2 ** attempt))
+                logger.warning(f"Ошибка Google Sheets на листе '{self.title}' ({method}): {e} | Повтор через {delay:.2f} сек")
+                blocking_sleep(delay)  # _call выполняется в рабочем потоке, event loop не ждёт
+            else:
+                self.breaker.record_success()
+                return result
+
+    def _write(self, method: str, *args, **kwargs):
+        # Запись с уведомлением до и после неё (см. Tenant.note_write_started)
+        if self.before_write:
+            self.before_write()
+        result = self._call(method, *args, **kwargs)
+        if self.on_write:
+            self.on_write()
+        return result
+
+    def _append(self, method: str, *args, defer: bool = True, **kwargs):
+        # defer=False — запись нужна сейчас, при недоступности листа ошибка передаётся вызывающему
+        with self.write_lock:
+            # Пока в очереди есть записи, новые тоже встают в очередь, чтобы не нарушить порядок строк
+            if self.pending_writes:
+                if not defer:
+                    raise SheetsUnavailable(f"На листе '{self.title}' есть отложенные записи")
+                self.pending_writes.append((method, args, kwargs, False))
+                return None
+            try:
+                return self._write(method, *args, **kwargs)
+            except Exception as e:
+                if not defer or not is_unavailable(e):
+                    raise
+                # После неоднозначной ошибки строки могли записаться, перед дозаписью это проверяется
+                self.pending_writes.append((method, args, kwargs, is_ambiguous(e)))
+                logger.warning(f"Лист '{self.title}' недоступен, запись отложена | В очереди: {len(self.pending_writes)}")
+                return None
+
+    def _flush(self):
+        with self.write_lock:
+            while self.pending_writes:
+                method, args, kwargs, uncertain = self.pending_writes[0]
+                rows = args[0] if method == "append_rows" else [args[0]]
+                if not (uncertain and self._ends_with(rows)):
+                    try:
+                        self._write(method, *args, **kwargs)
+                    except Exception as e:
+                        if is_ambiguous(e):
+                            self.pending_writes[0] = (method, args, kwargs, True)
+                        raise
+                self.pending_writes.popleft()
+
+    def _ends_with(self, rows: list) -> bool:
+        # Свежее чтение без подстановки последних полученных данных
+        values = self._call("get_all_values", value_render_option="UNFORMATTED_VALUE")
+        if len(values) < len(rows):
+            return False
+        return all(same_row(cell_row, row) for cell_row, row in zip(values[len(values) - len(rows):], rows))
+
+    async def ends_with(self, rows: list) -> bool:
+        # Проверяет, что последние строки листа совпадают с rows
+        return await run_sheets(self._ends_with, rows)
+
+    async def flush_pending_writes(self):
+        await run_sheets(self._flush)
+
+    async def get_rows(self, start_row: int, end_row: int) -> list:
+        return await run_sheets(self._call, "get_values", f"A{start_row}:Z{end_row}", value_render_option="UNFORMATTED_VALUE")
+
+    async def get_all_values(self, **kwargs):
+        key = tuple(sorted(kwargs.items()))
+        try:
+            values = await run_sheets(self._call, "get_all_values", **kwargs)
+        except Exception as e:
+            if key not in self.last_good or not is_unavailable(e):
+                raise
+            self.degraded_reads += 1
+            logger.warning(f"Лист '{self.title}' недоступен, используются последние полученные данные: {e}")
+            return self.last_good[key]
+        self.last_good[key] = values
+        return values
 
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-credentials = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-gc = gspread.authorize(credentials)
-users_sheet = gc.open(GOOGLE_SHEET_NAME).worksheet(SHEET_NAME)
-offers_sheet = gc.open(GOOGLE_SHEET_NAME).worksheet("Предложения о покупке")
-requests_sheet = gc.open(GOOGLE_SHEET_NAME).worksheet("Запрос")
-gold_sheet = gc.open(GOOGLE_SHEET_NAME).worksheet("Золото")
-silver_sheet = gc.open(GOOGLE_SHEET_NAME).worksheet("Серебро")
-settings_sheet = gc.open(GOOGLE_SHEET_NAME).worksheet("Настройки")
+    async def append_row(self, values, defer: bool = True, **kwargs):
+        return await run_sheets(self._append, "append_row", values, defer=defer, **kwargs)
+
+    async def append_rows(self, values, defer: bool = True, **kwargs):
+        return await run_sheets(self._append, "append_rows", values, defer=defer, **kwargs)
+
+    async def delete_rows(self, start_index, end_index=None):
+        return await run_sheets(self._write, "delete_rows", start_index, end_index)
+
+    def metrics(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "failures": self.breaker.failures,
+            "retries": self.retries,
+            "degraded_reads": self.degraded_reads,
+            "queued_writes": len(self.pending_writes),
+        }
+
+class SheetView:
+    # Кэш декодированных строк листа, который редактируют вручную. Перечитывается
+    # только после сигнала об изменении таблицы (см. poll_sheet_changes) или по возрасту.
+    def __init__(self, sheet: GovernedSheet, record_cls):
+        self.sheet = sheet
+        self.record_cls = record_cls
+        self.records = None
+        self.loaded_at = 0.0
+
+    async def get(self) -> list:
+        if self.records is None or monotonic() - self.loaded_at > VIEW_MAX_AGE:
+            self.records = decode_rows(await self.sheet.get_all_values(), self.record_cls)
+            self.loaded_at = monotonic()
+        return self.records
+
+    def add(self, record):
+        # Строка, которую бот сам дописал в лист, попадает в кэш без перечитывания
+        if self.records is not None:
+            self.records.append(record)
+
+    def invalidate(self):
+        self.records = None
+
+class AudienceIndex:
+    # Подписанные на уведомления пользователи, сгруппированные по типу организации.
+    # Строится из кэша листа "Пользователи": новые регистрации дописываются в индекс,
+    # после перечитывания листа индекс пересобирается. Список получателей — без запросов к таблице.
+    def __init__(self, view: SheetView):
+        self.view = view
+        self.records = None
+        self.indexed = 0
+        self.user_ids = set()
+        self.everyone = []
+        self.segments = {}
+
+    async def refresh(self):
+        records = await self.view.get()
+        if records is not self.records:
+            self.records = records
+            self.indexed = 0
+            self.user_ids = set()
+            self.everyone = []
+            self.segments = {}
+        for user in records[self.indexed:]:
+            if user.notify and user.user_id and user.user_id not in self.user_ids:
+                self.user_ids.add(user.user_id)
+                self.everyone.append(user)
+                self.segments.setdefault(user.org_type, []).append(user)
+        self.indexed = len(records)
+
+    async def recipients(self, segments: tuple = ()) -> list:
+        await self.refresh()
+        if not segments:
+            return self.everyone
+        if len(segments) == 1:
+            return self.segments.get(segments[0], [])
+        return [user for segment in segments for user in self.segments.get(segment, [])]
+
+class Tenant:
+    def __init__(self, name: str, token: str, sheet_name: str, group_chat_id: str,
+                 admin_ids: list, session: AiohttpSession):
+        self.name = name
+        self.sheets = []
+        self.bot = Bot(token=token, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+        self.chat_id = group_chat_id
+        self.admin_ids = admin_ids
+        sheets_quota.acquire()
+        self.spreadsheet = gc.open(sheet_name)
+        # Из кэшируемых листов бот дописывает строки только в "Пользователи": только его
+        # записи считаются своими при проверке изменений (см. poll_sheet_changes)
+        self.users_sheet = self.open_sheet(SHEET_NAME, track_writes=True)
+        self.offers_sheet = self.open_sheet(OFFERS_SHEET_NAME)
+        self.requests_sheet = self.open_sheet("Запрос")
+        self.gold_sheet = self.open_sheet("Золото")
+        self.silver_sheet = self.open_sheet("Серебро")
+        self.settings_sheet = self.open_sheet("Настройки")
+        self.offers_archive_sheets = {}
+        self.active_timers = {}
+        self.users_view = SheetView(self.users_sheet, UserRecord)
+        self.settings_view = SheetView(self.settings_sheet, SettingRecord)
+        self.requests_view = SheetView(self.requests_sheet, RequestRecord)
+        self.audience = AudienceIndex(self.users_view)
+        self.modified_time = None  # modifiedTime таблицы на момент последней проверки
+        self.own_modified_time = None  # modifiedTime сразу после последней записи бота
+        self.foreign_change = False  # таблицу изменили до записи бота, но после проверки
+
+    # open_sheet, add_sheet и list_worksheets блокируют поток, вызываются через run_sheets
+    def open_sheet(self, title: str, track_writes: bool = False) -> GovernedSheet:
+        sheets_quota.acquire()
+        return self.wrap_sheet(self.spreadsheet.worksheet(title), track_writes)
+
+    def add_sheet(self, title: str, cols: int) -> GovernedSheet:
+        sheets_quota.acquire()
+        return self.wrap_sheet(self.spreadsheet.add_worksheet(title=title, rows=1, cols=cols))
+
+    def list_worksheets(self) -> list:
+        sheets_quota.acquire()
+        return self.spreadsheet.worksheets()
+
+    def wrap_sheet(self, worksheet, track_writes: bool = False) -> GovernedSheet:
+        if track_writes:
+            sheet = GovernedSheet(worksheet, before_write=self.note_write_started, on_write=self.note_write_finished)
+        else:
+            sheet = GovernedSheet(worksheet)
+        self.sheets.append(sheet)
+        return sheet
+
+    # Вызываются в рабочем потоке вокруг записи бота в лист "Пользователи". Своя запись
+    # узнаётся по modifiedTime, полученному от Google сразу после неё, без сравнения
+    # с локальными часами. Правка, сделанная до записи бота, не скрывается ею.
+    def note_write_started(self):
+        try:
+            modified = fetch_modified_time(self)
+        except Exception as e:
+            modified = None
+            logger.warning(f"Не удалось получить время изменения таблицы перед записью: {e}")
+        if modified is None or modified not in (self.modified_time, self.own_modified_time):
+            self.foreign_change = True
+
+    def note_write_finished(self):
+        try:
+            self.own_modified_time = fetch_modified_time(self)
+        except Exception as e:
+            self.own_modified_time = None
+            logger.warning(f"Не удалось получить время изменения таблицы после записи: {e}")
+
+    def views(self) -> list:
+        return [self.users_view, self.settings_view, self.requests_view]
+
+sheets_quota = SheetsQuota(SHEETS_QUOTA_PER_MINUTE)
+gc = None
+tenants = []
+tenants_by_bot_id = {}
+current_tenant = ContextVar("current_tenant")
+activity_labels = {}  # задача asyncio -> какое обновление или задачу планировщика она выполняет
+
+def tenant() -> Tenant:
+    return current_tenant.get()
+
+def load_tenant_configs() -> list:
+    # Без файла конфигурации работает один бот с настройками из констант выше
+    if not os.path.exists(TENANTS_FILE):
+        return [{
+            "name": "default",
+            "token": TOKEN,
+            "spreadsheet": GOOGLE_SHEET_NAME,
+            "chat_id": chat_id,
+            "admin_ids": ADMIN_IDS,
+        }]
+    with open(TENANTS_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def build_tenants():
+    global gc
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    credentials = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
+    gc = gspread.authorize(credentials)
+    session = AiohttpSession()
+    for config in load_tenant_configs():
+        t = Tenant(
+            name=config["name"],
+            token=config["token"],
+            sheet_name=config["spreadsheet"],
+            group_chat_id=config["chat_id"],
+            admin_ids=config.get("admin_ids", []),
+            session=session,
+        )
+        tenants.append(t)
+        tenants_by_bot_id[t.bot.id] = t
+    return tenants
+
+def fetch_modified_time(t: Tenant) -> datetime:
+    # Один лёгкий запрос к Drive API (modifiedTime) вместо чтения листов целиком
+    sheets_quota.acquire()
+    return datetime.fromisoformat(t.spreadsheet.get_lastUpdateTime().replace("Z", "+00:00"))
+
+async def poll_sheet_changes():
+    # Сбрасывает кэши листов, если таблицу изменил кто-то кроме самого бота.
+    # Своим считается только изменение, modifiedTime которого совпадает с полученным сразу
+    # после записи бота в лист "Пользователи": эти строки уже внесены в кэш через SheetView.add().
+    # Любая другая запись, в том числе бота в остальные листы, сбрасывает кэши.
+    t = tenant()
+    try:
+        modified = await run_sheets(fetch_modified_time, t)
+        if t.modified_time is None or modified == t.modified_time:
+            t.modified_time = modified
+            return
+        t.modified_time = modified
+        if modified == t.own_modified_time and not t.foreign_change:
+            return
+        t.foreign_change = False
+        for view in t.views():
+            view.invalidate()
+        log_event("SYSTEM", None, f"Таблица изменена в {modified.strftime('%H:%M:%S')} UTC, кэши листов сброшены")
+    except Exception as e:
+        log_event("ERROR", None, f"Ошибка проверки изменений таблицы: {e}")
+
+async def flush_sheet_writes():
+    # Дозаписывает строки, отложенные пока лист был недоступен
+    for sheet in tenant().sheets:
+        if not sheet.pending_writes or sheet.breaker.is_blocked():
+            continue
+        queued = len(sheet.pending_writes)
+        try:
+            await sheet.flush_pending_writes()
+            log_event("SYSTEM", None, f"Отложенные записи на лист '{sheet.title}' выполнены: {queued}")
+        except Exception as e:
+            log_event("ERROR", None, f"Не удалось выполнить отложенные записи на лист '{sheet.title}': {e}")
+
+def sheets_metrics() -> dict:
+    return {t.name: {sheet.title: sheet.metrics() for sheet in t.sheets} for t in tenants}
+
+async def run_as_tenant(t: Tenant, job):
+    # Задачи планировщика общие, но каждая выполняется в контексте своего бота
+    token = current_tenant.set(t)
+    task = asyncio.current_task()
+    activity_labels[task] = f"job {job.__name__} [{t.name}]"
+    try:
+        await job()
+    finally:
+        activity_labels.pop(task, None)
+        current_tenant.reset(token)
+
+#  Секционирование листа предложений
+def offers_archive_title(month: date) -> str:
+    return f"{OFFERS_SHEET_NAME} {month.strftime('%Y-%m')}"
+
+async def get_offers_archive(month: date, header: list = None):
+    # Возвращает архивный лист за месяц; при переданном header создаёт недостающий
+    t = tenant()
+    title = offers_archive_title(month)
+    if title in t.offers_archive_sheets:
+        return t.offers_archive_sheets[title]
+    try:
+        sheet = await run_sheets(t.open_sheet, title)
+    except gspread.exceptions.WorksheetNotFound:
+        if header is None:
+            return None
+        sheet = await run_sheets(t.add_sheet, title, len(header))
+        await sheet.append_row(header)
+    t.offers_archive_sheets[title] = sheet
+    return sheet
+
+async def offers_archive_months() -> list:
+    # Месяцы, за которые в таблице есть архивные листы
+    prefix = f"{OFFERS_SHEET_NAME} "
+    return sorted(
+        datetime.strptime(worksheet.title[len(prefix):], "%Y-%m").date()
+        for worksheet in await run_sheets(tenant().list_worksheets)
+        if worksheet.title.startswith(prefix) and re.fullmatch(r"\d{4}-\d{2}", worksheet.title[len(prefix):])
+    )
+
+async def offers_partitions(start: date, end: date) -> list:
+    # Секции, которые пересекаются с периодом [start, end]: архивы месяцев до вчерашнего
+    # дня включительно и оперативный лист, если период захватывает сегодня
+    today = clock.now().date()
+    partitions = []
+    if start < today:
+        first, last = start.replace(day=1), min(end, today - timedelta(days=1))
+        for month in await offers_archive_months():
+            if first <= month <= last:
+                partitions.append(await get_offers_archive(month))
+    if end >= today:
+        partitions.append(tenant().offers_sheet)
+    return partitions
+
+async def read_offers(start: date, end: date) -> list:
+    # Читает только те секции, которые пересекаются с периодом [start, end]
+    offers = []
+    for sheet in await offers_partitions(start, end):
+        offers.extend(
+            offer for offer in decode_rows(await sheet.get_all_values(), OfferRecord)
+            if offer.date and start <= offer.date <= end
+        )
+    return offers
+
+async def delete_archived_offers(rows: list):
+    # Удаление не повторяется автоматически. Перед ним проверяется, что сверху оперативного
+    # листа всё ещё те строки, которые записаны в архив: иначе удалились бы строки не из архива.
+    t = tenant()
+    current = await t.offers_sheet.get_rows(2, len(rows) + 1)
+    if len(current) != len(rows) or not all(same_row(cell_row, row) for cell_row, row in zip(current, rows)):
+        raise SheetsUnavailable("Строки оперативного листа изменились после архивирования, удаление отменено")
+    await t.offers_sheet.delete_rows(2, len(rows) + 1)
+
+async def rollover_offers():
+    # Переносит строки прошлых дней из оперативного листа в архив по месяцам.
+    # Строки дописываются в конец листа, поэтому прошлые дни всегда идут сверху.
+    t = tenant()
+    try:
+        today = clock.now().date()
+        values = await t.offers_sheet.get_all_values(value_render_option="UNFORMATTED_VALUE")
+        if len(values) < 2:
+            return
+        header = [str(title).strip() for title in values[0]]
+        date_index = header.index("Дата")
+        batches = []  # подряд идущие строки одного месяца: [(месяц, строки)]
+        month = today.replace(day=1)
+        stale = 0
+        for row in values[1:]:
+            row_date = parse_date(str(row[date_index])) if date_index < len(row) else None
+            if row_date == today:
+                break
+            if row_date:
+                month = row_date.replace(day=1)
+            if not batches or batches[-1][0] != month:
+                batches.append((month, []))
+            batches[-1][1].append(row)
+            stale += 1
+        if not stale:
+            return
+        # Из оперативного листа удаляются только строки, которые точно записаны
+        # в архив: отложенная запись пропала бы при перезапуске
+        # Пачка, уже записанная в архив прошлым прерванным запуском или запросом, который
+        # завершился таймаутом, но выполнился, повторно не дописывается
+        archived = 0
+        try:
+            for month, rows in batches:
+                archive = await get_offers_archive(month, header=values[0])
+                if not await archive.ends_with(rows):
+                    try:
+                        await archive.append_rows(rows, defer=False)
+                    except Exception as e:
+                        if not is_ambiguous(e) or not await archive.ends_with(rows):
+                            raise
+                archived += len(rows)
+        finally:
+            if archived:
+                await delete_archived_offers(values[1:archived + 1])
+                log_event("SYSTEM", None, f"Архивировано предложений: {archived} из {stale}")
+    except Exception as e:
+        log_event("ERROR", None, f"Ошибка архивирования предложений: {e}")
 
 class Form(StatesGroup):
     name = State()
@@ -158,111 +954,289 @@ class Form(StatesGroup):
     def timeout(cls):
         return timedelta(minutes=30)
 
-bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+@dp.update.outer_middleware()
+async def tenant_context_middleware(handler, event, data):
+    # Все обработчики выполняются в контексте бота, получившего обновление
+    t = tenants_by_bot_id[data["bot"].id]
+    token = current_tenant.set(t)
+    task = asyncio.current_task()
+    activity_labels[task] = f"update {event.update_id} ({event.event_type}) [{t.name}]"
+    try:
+        return await handler(event, data)
+    finally:
+        activity_labels.pop(task, None)
+        current_tenant.reset(token)
+
+#  Отсев повторных обновлений
+# Telegram может повторно доставить обновление после сбоя сети, а пользователь —
+# дважды нажать кнопку, пока бот не убрал клавиатуру. Повтор отвечается сразу,
+# без запуска обработчика, чтобы не читать листы и не дописывать строки дважды.
+class RecentKeys:
+    # Ограниченный LRU недавно обработанных ключей с одинаковым временем жизни,
+    # поэтому порядок добавления совпадает с порядком истечения
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = collections.OrderedDict()
+
+    def seen(self, key) -> bool:
+        # True, если ключ уже встречался в пределах ttl; иначе ключ запоминается
+        now = monotonic()
+        while self.items and next(iter(self.items.values())) <= now:
+            self.items.popitem(last=False)
+        if key in self.items:
+            return True
+        self.items[key] = now + self.ttl
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+        return False
+
+    def forget(self, key):
+        self.items.pop(key, None)
+
+recent_updates = RecentKeys(RECENT_UPDATES_SIZE, RECENT_UPDATES_TTL)
+recent_callbacks = RecentKeys(RECENT_CALLBACKS_SIZE, RECENT_CALLBACKS_TTL)
+
+@dp.update.outer_middleware()
+async def deduplicate_updates_middleware(handler, event, data):
+    bot_id = data["bot"].id
+    if recent_updates.seen((bot_id, event.update_id)):
+        logger.info(f"Пропущено повторно доставленное обновление {event.update_id}")
+        return
+    callback = event.callback_query
+    if callback is None or callback.message is None:
+        return await handler(event, data)
+    key = (bot_id, callback.from_user.id, callback.message.message_id, callback.data)
+    if recent_callbacks.seen(key):
+        logger.info(f"Пропущено повторное нажатие '{callback.data}' от {callback.from_user.id}")
+        try:
+            await callback.answer()
+        except Exception:
+            pass
+        return
+    data["callback_key"] = key
+    try:
+        return await handler(event, data)
+    except Exception:
+        # Если обработчик упал, повторное нажатие должно сработать
+        recent_callbacks.forget(key)
+        raise
+
+#  Ограничение параллельности обработки обновлений
+# Обновления одного пользователя обрабатываются строго по очереди, общее число
+# одновременно работающих обработчиков ограничено. При переполнении очередей
+# пользователь получает ответ "бот занят" вместо бесконечного ожидания.
+class UserQueue:
+    __slots__ = ("lock", "size")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.size = 0
+
+handlers_semaphore = asyncio.Semaphore(MAX_CONCURRENT_HANDLERS)
+user_queues = {}
+pending_updates = 0
+
+async def reply_busy(event: types.Update):
+    try:
+        if event.callback_query:
+            await event.callback_query.answer(BUSY_TEXT, show_alert=True)
+        elif event.message:
+            await event.message.answer(BUSY_TEXT)
+    except Exception as e:
+        logger.warning(f"Не удалось отправить ответ о перегрузке: {e}")
+
+@dp.update.outer_middleware()
+async def ordered_dispatch_middleware(handler, event, data):
+    global pending_updates
+    user = data.get("event_from_user")
+    if user is None:
+        async with handlers_semaphore:
+            return await handler(event, data)
+    key = (data["bot"].id, user.id)
+    queue = user_queues.get(key)
+    # Лимиты проверяются до создания очереди, чтобы отклонённые обновления не оставляли пустых очередей
+    if (queue.size if queue else 0) >= MAX_USER_QUEUE or pending_updates >= MAX_PENDING_UPDATES:
+        log_event("SYSTEM", None, f"Обновление отклонено из-за перегрузки | user_id={user.id} | В очереди: {pending_updates}")
+        await reply_busy(event)
+        if "callback_key" in data:
+            # Пользователя просят повторить, повтор не должен считаться дублем
+            recent_callbacks.forget(data["callback_key"])
+        return
+    if queue is None:
+        queue = user_queues[key] = UserQueue()
+    queue.size += 1
+    pending_updates += 1
+    try:
+        async with queue.lock:
+            async with handlers_semaphore:
+                return await handler(event, data)
+    finally:
+        queue.size -= 1
+        pending_updates -= 1
+        if not queue.size:
+            del user_queues[key]
+
 @dp.update.middleware()
 async def check_message_age_middleware(handler, event, data):
     if isinstance(event, types.Message):
         message_time = event.date.replace(tzinfo=None)
-        if (datetime.now() - message_time) > MAX_MESSAGE_AGE:
+        if (clock.now() - message_time) > MAX_MESSAGE_AGE:
             print(f"Пропущено устаревшее сообщение от {event.from_user.id}")
             return
     return await handler(event, data)
 
-def get_user(user_id: int):
-    records = users_sheet.get_all_records()
-    for user in records:
-        if str(user["ID Telegram"]) == str(user_id):
-            return {
-                "name": user["Имя"],
-                "org": user["Организация"],
-                "org_type": user["Тип организации"]
-            }
+async def find_user_record(user_id: int):
+    for user in await tenant().users_view.get():
+        if user.user_id == user_id:
+            return user
     return None
 
-def is_registered(user_id: int) -> bool:
-    return get_user(user_id) is not None
+async def get_user(user_id: int):
+    user = await find_user_record(user_id)
+    return user.as_user_data() if user else None
+
+async def is_registered(user_id: int) -> bool:
+    return await get_user(user_id) is not None
     
-def is_offer_allowed():
+async def is_offer_allowed():
     try:
-        settings = settings_sheet.get_all_records()
-        for row in settings:
-            if row.get("Настройка", "").strip() == "Разрешить отправлять предложения":
-                return row.get("Признак", "").strip().lower() == "да"
+        for setting in await tenant().settings_view.get():
+            if setting.name == "Разрешить отправлять предложения":
+                return setting.value.lower() == "да"
     except Exception as e:
         logger.error(f"Ошибка чтения листа 'Настройки': {e}")
     return False
 
+#  Производственный календарь
+class BusinessCalendar:
+    # Рабочие интервалы по Москве, заранее рассчитанные на CALENDAR_HORIZON_DAYS вперёд.
+    # Праздники берутся из holidays.RU на нужные годы, горизонт продлевается сам,
+    # поэтому проверки "открыто сейчас" и "когда откроется" — поиск по индексу дня.
+    def __init__(self):
+        self.start = None
+        self.windows = []  # по дням от start: (открытие, закрытие) или None для выходного
+        self.next_open = []  # по дням от start: ближайшее открытие начиная с этого дня
+
+    def build(self, first_day: date):
+        days = [first_day + timedelta(days=offset) for offset in range(CALENDAR_HORIZON_DAYS)]
+        ru_holidays = holidays.RU(years=sorted({day.year for day in days}))
+        windows = []
+        for day in days:
+            # Проверка на будний день и праздник
+            if day.weekday() < 5 and day not in ru_holidays:  # 0-пн, 4-пт
+                windows.append((
+                    MSK_TZ.localize(datetime.combine(day, WORKDAY_START)),
+                    MSK_TZ.localize(datetime.combine(day, WORKDAY_END)),
+                ))
+            else:
+                windows.append(None)
+        next_open = [None] * len(days)
+        upcoming = None
+        for offset in reversed(range(len(days))):
+            if windows[offset]:
+                upcoming = windows[offset][0]
+            next_open[offset] = upcoming
+        self.start, self.windows, self.next_open = first_day, windows, next_open
+
+    def day_index(self, day: date) -> int:
+        # Пересчёт раз в год: за месяц до конца горизонта или если день вне его
+        if self.start is None or not 0 <= (day - self.start).days < CALENDAR_HORIZON_DAYS - 31:
+            self.build(day)
+        return (day - self.start).days
+
+    def is_working_day(self, day: date) -> bool:
+        index = self.day_index(day)
+        return self.windows[index] is not None
+
+    def is_open(self, moment: datetime = None) -> bool:
+        moment = moment or clock.now(MSK_TZ)
+        index = self.day_index(moment.date())
+        window = self.windows[index]
+        return window is not None and window[0] <= moment <= window[1]
+
+    def next_open_at(self, moment: datetime = None) -> datetime:
+        moment = moment or clock.now(MSK_TZ)
+        index = self.day_index(moment.date())
+        window = self.windows[index]
+        if window and moment <= window[1]:
+            return max(moment, window[0])
+        return self.next_open[index + 1]
+
+business_calendar = BusinessCalendar()
+
 def is_working_day_and_hours():
-    msk_tz = pytz.timezone("Europe/Moscow")
-    now = datetime.now(msk_tz)
-    today = now.date()
-    # Проверка на будний день
-    is_weekday = now.weekday() < 6  # 1-пн, 5-пт
-    # Проверка на праздник
-    is_not_holiday = today not in RU_HOLIDAYS
-    # Проверка на рабочее время
-    working_time = time(9, 0) <= now.time() <= time(23, 0)
-    return is_weekday and is_not_holiday and working_time   
+    return business_calendar.is_open()
+
+def closed_hours_text() -> str:
+    next_open = business_calendar.next_open_at()
+    text = (f"❌ Предложения принимаются только в рабочие дни (Пн–Пт, кроме праздников) "
+            f"и с {WORKDAY_START.strftime('%H:%M')} до {WORKDAY_END.strftime('%H:%M')} по Москве.😿")
+    if next_open:
+        text += f"\nБлижайшее время приёма: {next_open.strftime('%d.%m.%Y %H:%M')} МСК"
+    return text
 
 async def check_session_expired(chat_id: int, user_id: int) -> bool:
-    state = dp.fsm.resolve_context(bot, chat_id=chat_id, user_id=user_id)
+    t = tenant()
+    state = dp.fsm.resolve_context(t.bot, chat_id=chat_id, user_id=user_id)
     data = await state.get_data()
     if not data.get('deadline'):
         return False
-    if datetime.now() > data['deadline']:
-        if user_id in active_timers:
-            active_timers[user_id].cancel()
-            del active_timers[user_id]
+    if clock.now() > data['deadline']:
+        if user_id in t.active_timers:
+            t.active_timers[user_id].cancel()
+            del t.active_timers[user_id]
         await state.clear()
         return True
     return False
 
 async def send_timeout_notification(user_id: int, deadline: datetime):
-    user_data = get_user(user_id)
+    t = tenant()
+    user_data = await get_user(user_id)
     try:
-        now = datetime.now()
+        now = clock.now()
         wait_seconds = (deadline - now).total_seconds()
         if wait_seconds > 0:
-            await asyncio.sleep(wait_seconds)
-        if user_id not in active_timers:
+            await clock.sleep(wait_seconds)
+        if user_id not in t.active_timers:
             return
-        state = dp.fsm.resolve_context(bot, chat_id=user_id, user_id=user_id)
+        state = dp.fsm.resolve_context(t.bot, chat_id=user_id, user_id=user_id)
         data = await state.get_data()
         if data.get('deadline') == deadline and not data.get('timeout'):
-            timestamp = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+            timestamp = clock.now().strftime("%d.%m.%Y %H:%M:%S")
             # Если пользователь не предоставил котировку по первому металлу
             if 'quote_value' not in data:
-                gold_sheet.append_row([user_id, user_data["name"], user_data["org"], user_data["org_type"], timestamp, "Время вышло"])
-                silver_sheet.append_row([user_id, user_data["name"], user_data["org"], user_data["org_type"], timestamp, "Время вышло"])
+                await t.gold_sheet.append_row([user_id, user_data["name"], user_data["org"], user_data["org_type"], timestamp, "Время вышло"])
+                await t.silver_sheet.append_row([user_id, user_data["name"], user_data["org"], user_data["org_type"], timestamp, "Время вышло"])
                 log_event("QUOTE", user_data, "Время вышло | Не предоставлены котировки")
             # Если пользователь предоставил котировку по первому металлу, но не по второму
             elif 'quote_value' in data and 'second_metal' in data:
                 second_metal = data['second_metal']
-                sheet = gold_sheet if second_metal == "Золото" else silver_sheet
-                sheet.append_row([user_id, user_data["name"], user_data["org"], user_data["org_type"], timestamp, "Время вышло"])
+                sheet = t.gold_sheet if second_metal == "Золото" else t.silver_sheet
+                await sheet.append_row([user_id, user_data["name"], user_data["org"], user_data["org_type"], timestamp, "Время вышло"])
                 log_event("QUOTE", user_data, f"Время вышло | Не предоставлена котировка на {second_metal}")
             elif 'quote_value' in data and 'second_metal' not in data:
                 second_metal = "Серебро" if data['metal'] == "Золото" else "Золото"
-                sheet = gold_sheet if second_metal == "Золото" else silver_sheet
-                sheet.append_row([user_id, user_data["name"], user_data["org"], user_data["org_type"], timestamp, "Время вышло"])
+                sheet = t.gold_sheet if second_metal == "Золото" else t.silver_sheet
+                await sheet.append_row([user_id, user_data["name"], user_data["org"], user_data["org_type"], timestamp, "Время вышло"])
                 log_event("QUOTE", user_data, f"Время вышло | Предоставлена только котировка на {data['metal']}")
             try:
                 last_msg_id = data.get("last_inline_msg_id")
                 if last_msg_id:
-                    await bot.edit_message_reply_markup(chat_id=user_id, message_id=last_msg_id, reply_markup=None)
+                    await t.bot.edit_message_reply_markup(chat_id=user_id, message_id=last_msg_id, reply_markup=None)
             except Exception:
                 pass
             await state.update_data(timeout=True)
             try:
                 last_msg_id = data.get("last_inline_msg_id")
                 if last_msg_id:
-                    await bot.edit_message_reply_markup(chat_id=user_id, message_id=last_msg_id, reply_markup=None)
+                    await t.bot.edit_message_reply_markup(chat_id=user_id, message_id=last_msg_id, reply_markup=None)
             except Exception:
                 pass
-            await bot.send_message(
+            await t.bot.send_message(
                 chat_id=user_id,
                 text="⌛ Сожалеем, время для предоставления уровня дисконта/премии вышло!😿"
             )
@@ -272,15 +1246,16 @@ async def send_timeout_notification(user_id: int, deadline: datetime):
     except Exception as e:
         log_event("ERROR", None, f"Ошибка в send_timeout_notification: {e}")
     finally:
-        if user_id in active_timers:
-            del active_timers[user_id]
+        if user_id in t.active_timers:
+            del t.active_timers[user_id]
 
-def record_decline(user_id: int):
-    user_data = get_user(user_id)
+async def record_decline(user_id: int):
+    t = tenant()
+    user_data = await get_user(user_id)
     if not user_data:
         return False
-    timestamp = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-    gold_sheet.append_row([
+    timestamp = clock.now().strftime("%d.%m.%Y %H:%M:%S")
+    await t.gold_sheet.append_row([
         user_id,
         user_data["name"],
         user_data["org"],
@@ -288,7 +1263,7 @@ def record_decline(user_id: int):
         timestamp,
         "Отказ от предоставления"
     ])
-    silver_sheet.append_row([
+    await t.silver_sheet.append_row([
         user_id,
         user_data["name"],
         user_data["org"],
@@ -299,10 +1274,11 @@ def record_decline(user_id: int):
     return True
 
 async def clear_state_safely(user_id: int, state: FSMContext):
+    t = tenant()
     try:
-        if user_id in active_timers:
-            active_timers[user_id].cancel()
-            del active_timers[user_id]
+        if user_id in t.active_timers:
+            t.active_timers[user_id].cancel()
+            del t.active_timers[user_id]
         await state.clear()
     except Exception as e:
         logger.error(f"Ошибка при очистке состояния для {user_id}: {e}")
@@ -342,101 +1318,79 @@ def validate_quote(text: str) -> tuple[bool, str]:
         return False, "Введите число (например: 1,5 или -0,5)"
 
 async def send_scheduled_notifications():
+    t = tenant()
     try:
-        msk_timezone = pytz.timezone('Europe/Moscow')
-        now = datetime.now(msk_timezone)
-        current_time = now.strftime("%H:%M")
+        now = clock.now(MSK_TZ)
+        # В выходные и праздники рассылки нет, листы не читаются
+        if not business_calendar.is_working_day(now.date()):
+            return
+        current_time = now.time().replace(second=0, microsecond=0)
         logger.info(f"Проверка уведомлений в {now.strftime('%H:%M:%S')}")
-        try:
-            times = []
-            for record in requests_sheet.get_all_records():
-                send_time_str = record.get("Время отправки, МСК")
-                if send_time_str:
-                    try:
-                        send_time = datetime.strptime(send_time_str.strip(), "%H:%M").replace(
-                            year=now.year, month=now.month, day=now.day, tzinfo=msk_timezone)
-                        if send_time > now:
-                            times.append(send_time)
-                    except ValueError:
-                        continue
-            if times:
-                nearest = min(times)
-                delta = nearest - now
-                logger.info(f"Ближайшее уведомление запланировано на {nearest.strftime('%H:%M:%S')}")
-            else:
-                logger.info("На сегодня больше уведомлений не запланировано.")
-        except Exception as e:
-            logger.warning(f"Ошибка при попытке определить ближайшее уведомление: {e}")
-        records = requests_sheet.get_all_records()
+        records = await t.requests_view.get()
+        times = [
+            MSK_TZ.localize(datetime.combine(now.date(), record.send_time))
+            for record in records if record.send_time
+        ]
+        times = [send_time for send_time in times if send_time > now]
+        if times:
+            nearest = min(times)
+            logger.info(f"Ближайшее уведомление запланировано на {nearest.strftime('%H:%M:%S')}")
+        else:
+            logger.info("На сегодня больше уведомлений не запланировано.")
         for record in records:
-            if not record.get("Время отправки, МСК"):
+            if record.send_time != current_time:
                 continue
-            if record["Время отправки, МСК"].strip() == current_time:
-                notification_type = record.get("Тип уведомления", "").strip().lower()
-                users_data = users_sheet.get_all_values()
-                header = users_data[0]
+            try:
+                users_to_notify = await t.audience.recipients(record.segments)
+            except Exception as e:
+                log_event("ERROR", None, f"Не удалось загрузить пользователей: {e}")
+                continue
+            for user in users_to_notify:
+                user_id = user.user_id
+                user_data = user.as_user_data()
                 try:
-                    user_id_index = header.index("ID Telegram")
-                    notify_index = header.index("Отправка уведомления")
-                except ValueError as e:
-                    log_event("ERROR", None, f"Столбец не найден в заголовках: {header}")
-                    continue
-                users_to_notify = [
-                    row[user_id_index] for row in users_data[1:]
-                    if len(row) > notify_index and row[notify_index].strip().capitalize() == "Да"
-                ]
-                for user_id in users_to_notify:
-                    try:
-                        user_id = int(user_id)
-                        # Текстовое уведомление
-                        if notification_type == "текст":
-                            await bot.send_message(
-                                chat_id=user_id,
-                                text=record['Текст запроса'].strip()
-                            )
-                            user_data = get_user(user_id)
-                            if user_data:
-                                log_event("NOTIFY", user_data,
-                                          f"Текст: Текстовое уведомление отправлено")
-                            continue
-                        # Запрос котировка 
-                        # Корректная обработка времени ответа:
-                        response_time_str = str(record.get("Время ответа", "")).strip()
-                        if response_time_str.isdigit():
-                            response_time = int(response_time_str)
-                        else:
-                            response_time = 30   # если не указано время в гуглтаблице, то по умолчанию 30 минут
-                        state = dp.fsm.resolve_context(bot, chat_id=user_id, user_id=user_id)
-                        if user_id in active_timers:
-                            active_timers[user_id].cancel()
-                        deadline = datetime.now() + timedelta(minutes=response_time)
-                        await state.update_data(
-                            notification_time=datetime.now(),
-                            deadline=deadline
-                        )
-                        task = asyncio.create_task(
-                            send_timeout_notification(user_id, deadline)
-                        )
-                        active_timers[user_id] = task
-                        user_data = get_user(user_id)
-                        if user_data:
-                            log_event("NOTIFY", user_data,
-                                      f"Текст: Уведомление отправлено | Время ответа: {response_time} мин")
-                        msg = await bot.send_message(
+                    # Текстовое уведомление
+                    if record.kind is NotificationType.TEXT:
+                        await t.bot.send_message(
                             chat_id=user_id,
-                            text=f"{record['Текст запроса'].strip()}\n\n⏱ На предоставление котировок даётся {response_time} минут❗❗❗",
-                            reply_markup=get_notification_inline_kb()
+                            text=record.text
                         )
-                        await state.update_data(last_inline_msg_id=msg.message_id)
-                    except Exception as e:
-                        log_event("ERROR", None, f"Ошибка отправки user_id={user_id}: {e}")
+                        log_event("NOTIFY", user_data,
+                                  f"Текст: Текстовое уведомление отправлено")
+                        continue
+                    # Запрос котировка 
+                    # если не указано время в гуглтаблице, то по умолчанию 30 минут
+                    response_time = record.response_time if record.response_time and record.response_time > 0 else 30
+                    state = dp.fsm.resolve_context(t.bot, chat_id=user_id, user_id=user_id)
+                    if user_id in t.active_timers:
+                        t.active_timers[user_id].cancel()
+                    deadline = clock.now() + timedelta(minutes=response_time)
+                    await state.update_data(
+                        notification_time=clock.now(),
+                        deadline=deadline
+                    )
+                    task = asyncio.create_task(
+                        send_timeout_notification(user_id, deadline),
+                        name=f"timeout:{user_id}:{deadline.strftime('%H:%M:%S')}"
+                    )
+                    t.active_timers[user_id] = task
+                    log_event("NOTIFY", user_data,
+                              f"Текст: Уведомление отправлено | Время ответа: {response_time} мин")
+                    msg = await t.bot.send_message(
+                        chat_id=user_id,
+                        text=f"{record.text}\n\n⏱ На предоставление котировок даётся {response_time} минут❗❗❗",
+                        reply_markup=get_notification_inline_kb()
+                    )
+                    await state.update_data(last_inline_msg_id=msg.message_id)
+                except Exception as e:
+                    log_event("ERROR", None, f"Ошибка отправки user_id={user_id}: {e}")
     except Exception as e:
         log_event("ERROR", None, f"Ошибка рассылки: {e}")
 
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
-    offers_allowed = is_offer_allowed()
-    if is_registered(message.from_user.id):
+    offers_allowed = await is_offer_allowed()
+    if await is_registered(message.from_user.id):
         await message.answer("Главное меню:", reply_markup=get_main_inline_kb(offers_allowed=offers_allowed))
     else:
         await message.answer(
@@ -446,13 +1400,13 @@ async def cmd_start(message: types.Message):
 
 @dp.message(Command("send_offer"))
 async def send_offer_command(message: types.Message, state: FSMContext):
-    if not is_offer_allowed():
+    if not await is_offer_allowed():
         await message.answer("Подача предложений временно недоступна.")
         return
     if not is_working_day_and_hours():
-        await message.answer("❌ Предложения принимаются только в рабочие дни (Пн–Пт, кроме праздников) и с 09:00 до 18:00 по Москве.😿")
+        await message.answer(closed_hours_text())
         return
-    if is_registered(message.from_user.id):
+    if await is_registered(message.from_user.id):
         await state.set_state(Form.offer_metal)
         await message.answer(
             "Выберите, пожалуйста, металл:",
@@ -479,7 +1433,7 @@ async def help_menu_callback(callback: types.CallbackQuery):
 
 @dp.callback_query(F.data == "registration")
 async def callback_registration(callback: types.CallbackQuery, state: FSMContext):
-    if is_registered(callback.from_user.id):
+    if await is_registered(callback.from_user.id):
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.message.answer("Вы уже зарегистрированы!")
         return
@@ -529,8 +1483,9 @@ async def process_org_type_cb(callback: types.CallbackQuery, state: FSMContext):
 async def skip_contacts_cb(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.edit_reply_markup(reply_markup=None)
     data = await state.get_data()
-    users_sheet.append_row([
-        datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+    t = tenant()
+    await t.users_sheet.append_row([
+        clock.now().strftime("%d.%m.%Y %H:%M:%S"),
         callback.from_user.id,
         data['name'],
         data['organization'],
@@ -538,6 +1493,8 @@ async def skip_contacts_cb(callback: types.CallbackQuery, state: FSMContext):
         data['org_type'],
         "Да"
     ])
+    t.users_view.add(UserRecord(callback.from_user.id, data['name'], data['organization'],
+                                "Не указано", data['org_type'], True))
     user_data = {
         "name": data['name'],
         "org": data['organization'],
@@ -557,8 +1514,9 @@ async def process_contacts(message: types.Message, state: FSMContext):
         )
         return
     data = await state.get_data()
-    users_sheet.append_row([
-        datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+    t = tenant()
+    await t.users_sheet.append_row([
+        clock.now().strftime("%d.%m.%Y %H:%M:%S"),
         message.from_user.id,
         data['name'],
         data['organization'],
@@ -566,6 +1524,8 @@ async def process_contacts(message: types.Message, state: FSMContext):
         data['org_type'],
         "Да"
     ])
+    t.users_view.add(UserRecord(message.from_user.id, data['name'], data['organization'],
+                                message.text.strip(), data['org_type'], True))
     user_data = {
         "name": data['name'],
         "org": data['organization'],
@@ -580,13 +1540,13 @@ async def process_contacts(message: types.Message, state: FSMContext):
 async def process_offer_metal_cb(callback: types.CallbackQuery, state: FSMContext):
     if not is_working_day_and_hours():
         await callback.message.edit_reply_markup(reply_markup=None)
-        await callback.message.answer("❌ Предложения принимаются только в рабочие дни (Пн–Пт, кроме праздников) и с 09:00 до 18:00 по Москве.😿")
+        await callback.message.answer(closed_hours_text())
         await state.clear()
         return
     metal = "Золото" if callback.data == "metal_gold" else "Серебро"
     # --- Проверка лимита ---
     user_id = callback.from_user.id
-    count = offers_today_count(user_id, metal)
+    count = await offers_today_count(user_id, metal)
     if count >= 2:
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.message.answer(
@@ -605,22 +1565,22 @@ async def process_offer_metal_cb(callback: types.CallbackQuery, state: FSMContex
 
 @dp.callback_query(F.data == "start_offer")
 async def callback_start_offer(callback: types.CallbackQuery, state: FSMContext):
-    if not is_offer_allowed():
+    if not await is_offer_allowed():
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.message.answer("Подача предложений временно недоступна.😿")
         return
     # --- Ограничение по времени ---
     if not is_working_day_and_hours():
         await callback.message.edit_reply_markup(reply_markup=None)
-        await callback.message.answer("❌ Предложения принимаются только в рабочие дни (Пн–Пт, кроме праздников) и с 09:00 до 18:00 по Москве.😿")
+        await callback.message.answer(closed_hours_text())
         await state.clear()
         return
     # --- конец проверки ---
-    if not is_registered(callback.from_user.id):
+    if not await is_registered(callback.from_user.id):
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.message.answer("❌ Сначала пройдите регистрацию!", reply_markup=get_reg_inline_kb())
         return
-    user_data = get_user(callback.from_user.id)
+    user_data = await get_user(callback.from_user.id)
     if not user_data:
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.message.answer("❌ Ошибка: данные пользователя не найдены!")
@@ -674,29 +1634,13 @@ async def process_offer_quote(message: types.Message, state: FSMContext):
         return
     quote = float(message.text.replace(",", "."))
     data = await state.get_data()
-    user_data = get_user(message.from_user.id)
+    user_data = await get_user(message.from_user.id)
     if not user_data:
         await message.answer("❌ Ошибка: данные пользователя не найдены!")
         await state.clear()
         return
-    today = datetime.now().date()
     metal = data['metal']
-    all_offers = offers_sheet.get_all_records()
-    user_offers_today = []
-    for row in all_offers:
-        try:
-            if (
-                str(row.get("ID Telegram", "")) == str(message.from_user.id)
-                and str(row.get("Металл", "")) == metal
-            ):
-                date_str = str(row.get("Дата", "")).strip()
-                if date_str:
-                    row_date = datetime.strptime(date_str.split()[0], "%d.%m.%Y").date()
-                    if row_date == today:
-                        user_offers_today.append(row)
-        except Exception:
-            continue
-    if len(user_offers_today) >= 2:
+    if await offers_today_count(message.from_user.id, metal) >= 2:
         await message.answer(f"❌ Вы уже отправили 2 предложения на {metal} сегодня. Новое предложение на {metal} можно будет отправить завтра.")
         await state.clear()
         return
@@ -736,22 +1680,19 @@ async def process_offer_note(message: types.Message, state: FSMContext):
 
 @dp.callback_query(Form.offer_confirm, F.data == "offer_send")
 async def process_offer_send(callback: types.CallbackQuery, state: FSMContext):
+    t = tenant()
     await callback.message.edit_reply_markup(reply_markup=None)
     data = await state.get_data()
-    user_data = get_user(callback.from_user.id)
-    contacts = "Не указаны"
-    records = users_sheet.get_all_records()
-    for user in records:
-        if str(user["ID Telegram"]) == str(callback.from_user.id):
-            contacts = user.get("Контакты", "Не указаны")
-            break
+    user = await find_user_record(callback.from_user.id)
+    user_data = user.as_user_data()
+    contacts = user.contacts or "Не указаны"
     # Запись в Google Sheets с учётом столбца Примечание
-    offers_sheet.append_row([
+    await t.offers_sheet.append_row([
         callback.from_user.id,
         user_data["name"],
         user_data["org"],
         user_data["org_type"],
-        datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+        clock.now().strftime("%d.%m.%Y %H:%M:%S"),
         data['metal'],
         data['quantity'],
         data['quote'],
@@ -768,8 +1709,8 @@ async def process_offer_send(callback: types.CallbackQuery, state: FSMContext):
         f"• Примечание: {data.get('note', '') if data.get('note', '') else '—'}"
     )
     try:
-        await bot.send_message(
-            chat_id=chat_id,
+        await t.bot.send_message(
+            chat_id=t.chat_id,
             text=f"📨 Новое предложение о покупке:\n"
                  f"• От: {user_data['org']} ({user_data['name']})\n"
                  f"• Контакты: {contacts}\n"
@@ -816,15 +1757,16 @@ async def callback_send_quotes(callback: types.CallbackQuery, state: FSMContext)
 
 @dp.callback_query(F.data == "decline_quotes")
 async def callback_decline_quotes(callback: types.CallbackQuery, state: FSMContext):
+    t = tenant()
     data = await state.get_data()
     if data.get("timeout"):
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.message.answer("⌛Сожалеем, время для предоставления уровня дисконта/премии вышло!😿")
         return
-    if callback.from_user.id in active_timers:
-        active_timers[callback.from_user.id].cancel()
-        del active_timers[callback.from_user.id]
-    if not record_decline(callback.from_user.id):
+    if callback.from_user.id in t.active_timers:
+        t.active_timers[callback.from_user.id].cancel()
+        del t.active_timers[callback.from_user.id]
+    if not await record_decline(callback.from_user.id):
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.message.answer("❌ Ошибка при обработке запроса")
         return
@@ -836,6 +1778,7 @@ async def callback_decline_quotes(callback: types.CallbackQuery, state: FSMConte
 
 @dp.message(Form.quote_value)
 async def process_quote_value(message: types.Message, state: FSMContext):
+    t = tenant()
     data = await state.get_data()
     if data.get("timeout"):
         await message.answer("⌛ Сожалеем, время для предоставления уровня дисконта/премии вышло!😿")
@@ -846,17 +1789,17 @@ async def process_quote_value(message: types.Message, state: FSMContext):
         await message.answer(f"❌ {error_msg}\nПопробуйте еще раз:")
         return
     quote = float(message.text.replace(",", "."))
-    user_data = get_user(message.from_user.id)
+    user_data = await get_user(message.from_user.id)
     current_metal = data['metal']
     if user_data:
         log_event("QUOTE", user_data, f"Металл: {current_metal} | {quote}%")
-    sheet = gold_sheet if current_metal == "Золото" else silver_sheet
-    sheet.append_row([
+    sheet = t.gold_sheet if current_metal == "Золото" else t.silver_sheet
+    await sheet.append_row([
         message.from_user.id,
         user_data["name"],
         user_data["org"],
         user_data["org_type"],
-        datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+        clock.now().strftime("%d.%m.%Y %H:%M:%S"),
         quote
     ])
     await state.update_data(quote_value=quote)
@@ -893,6 +1836,7 @@ async def yes_second_metal_cb(callback: types.CallbackQuery, state: FSMContext):
 
 @dp.callback_query(F.data == "no_second_metal")
 async def no_second_metal_cb(callback: types.CallbackQuery, state: FSMContext):
+    t = tenant()
     data = await state.get_data()
     if data.get("timeout"):
         await callback.message.edit_reply_markup(reply_markup=None)
@@ -900,16 +1844,16 @@ async def no_second_metal_cb(callback: types.CallbackQuery, state: FSMContext):
         return
     await callback.message.edit_reply_markup(reply_markup=None)
     second_metal = data.get('second_metal')
-    user_data = get_user(callback.from_user.id)
+    user_data = await get_user(callback.from_user.id)
     if user_data:
         log_event("QUOTE", user_data, f"Отказ от предоставления уровня для {second_metal}")
-    sheet = gold_sheet if second_metal == "Золото" else silver_sheet
-    sheet.append_row([
+    sheet = t.gold_sheet if second_metal == "Золото" else t.silver_sheet
+    await sheet.append_row([
         callback.from_user.id,
         user_data["name"],
         user_data["org"],
         user_data["org_type"],
-        datetime.now().strftime("%d.%m.%Y %H:%M:%S"),
+        clock.now().strftime("%d.%m.%Y %H:%M:%S"),
         "Отказ от предоставления"
     ])
     await callback.message.answer(
@@ -917,6 +1861,348 @@ async def no_second_metal_cb(callback: types.CallbackQuery, state: FSMContext):
     )
     await clear_state_safely(callback.from_user.id, state)
 
+#  Профилирование по запросу администратора
+def sample_loop_stacks(thread_id: int, seconds: float, stop_event: threading.Event):
+    # Выполняется в отдельном потоке: периодически снимает стек потока event loop
+    # и сворачивает его в формат folded (flamegraph.pl, speedscope)
+    stacks = {}
+    samples = 0
+    finish = monotonic() + seconds
+    while not stop_event.is_set() and monotonic() < finish:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            stacks[stack] = stacks.get(stack, 0) + 1
+            samples += 1
+        stop_event.wait(PROFILE_INTERVAL)
+    return stacks, samples
+
+def snapshot_tasks() -> str:
+    tasks = sorted(asyncio.all_tasks(), key=lambda t: t.get_name())
+    lines = [f"Задач asyncio: {len(tasks)}"]
+    for task in tasks:
+        coro = task.get_coro()
+        lines.append(f"\n{task.get_name()} | {getattr(coro, '__qualname__', coro)}")
+        for frame in task.get_stack():
+            lines.append(f"    {frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}")
+    for t in tenants:
+        lines.append(f"\nОжидающие send_timeout_notification [{t.name}]: {len(t.active_timers)}")
+        for user_id, task in t.active_timers.items():
+            lines.append(f"    user_id={user_id} | {task.get_name()}")
+    return "\n".join(lines)
+
+async def run_profile(admin_chat_id: int, seconds: int, stop_event: threading.Event):
+    global profile_stop_event
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        tasks_path = os.path.join(PROFILE_DIR, f"tasks_{stamp}.txt")
+        with open(tasks_path, "w", encoding="utf-8") as f:
+            f.write(snapshot_tasks())
+        stacks, samples = await asyncio.to_thread(
+            sample_loop_stacks, threading.get_ident(), seconds, stop_event
+        )
+        profile_path = os.path.join(PROFILE_DIR, f"profile_{stamp}.folded")
+        with open(profile_path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        log_event("SYSTEM", None, f"Профиль сохранён: {profile_path} | Сэмплов: {samples}")
+        if PROFILE_SEND_TO_CHAT:
+            await tenant().bot.send_document(admin_chat_id, FSInputFile(profile_path),
+                                    caption=f"Профиль event loop, сэмплов: {samples}")
+            await tenant().bot.send_document(admin_chat_id, FSInputFile(tasks_path),
+                                    caption="Снимок задач asyncio")
+    except Exception as e:
+        log_event("ERROR", None, f"Ошибка профилирования: {e}")
+    finally:
+        profile_stop_event = None
+
+@dp.message(Command("profile"))
+async def profile_command(message: types.Message, command: CommandObject):
+    global profile_stop_event
+    if message.from_user.id not in tenant().admin_ids:
+        return
+    if profile_stop_event is not None:
+        await message.answer("Профилирование уже запущено. Остановить: /profile_stop")
+        return
+    try:
+        seconds = int(command.args) if command.args else 30
+    except ValueError:
+        await message.answer("Укажите длительность в секундах, например: /profile 30")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    profile_stop_event = threading.Event()
+    asyncio.create_task(run_profile(message.chat.id, seconds, profile_stop_event), name="profile")
+    await message.answer(f"Профилирование запущено на {seconds} сек. Остановить досрочно: /profile_stop")
+
+@dp.message(Command("profile_stop"))
+async def profile_stop_command(message: types.Message):
+    if message.from_user.id not in tenant().admin_ids:
+        return
+    if profile_stop_event is None:
+        await message.answer("Профилирование не запущено.")
+        return
+    profile_stop_event.set()
+    await message.answer("Профилирование остановлено, профиль сохраняется.")
+
+#  Выгрузка истории в CSV/Parquet
+# Предложения и котировки читаются из таблицы порциями и раскладываются по файлам
+# <папка>/<стол>/<набор>/metal=<металл>/month=<ГГГГ-ММ>/part-<время выгрузки>.csv|.parquet.
+# Каждая выгрузка дописывает только строки новее сохранённой отметки, поэтому
+# аналитикам не нужно обращаться к рабочей таблице.
+METAL_SLUGS = {"Золото": "gold", "Серебро": "silver"}
+
+def to_export_str(value) -> str:
+    return str(value).strip()
+
+def to_export_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def to_export_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", "."))
+    except ValueError:
+        return None
+
+def to_export_timestamp(value):
+    try:
+        return datetime.strptime(str(value).strip(), "%d.%m.%Y %H:%M:%S")
+    except ValueError:
+        return None
+
+def to_export_status(value) -> str:
+    # В листах котировок вместо числа может стоять "Время вышло" или "Отказ от предоставления"
+    return "" if to_export_float(value) is not None else str(value).strip()
+
+# (столбец в файле, номер столбца листа, парсер значения из листа, тип в Parquet)
+OFFER_EXPORT_COLUMNS = (
+    ("user_id", 0, to_export_int, "int64"),
+    ("name", 1, to_export_str, "string"),
+    ("org", 2, to_export_str, "string"),
+    ("org_type", 3, to_export_str, "string"),
+    ("created_at", 4, to_export_timestamp, "timestamp"),
+    ("metal", 5, to_export_str, "string"),
+    ("quantity_kg", 6, to_export_float, "float64"),
+    ("quote_pct", 7, to_export_float, "float64"),
+    ("note", 8, to_export_str, "string"),
+)
+QUOTE_EXPORT_COLUMNS = (
+    ("user_id", 0, to_export_int, "int64"),
+    ("name", 1, to_export_str, "string"),
+    ("org", 2, to_export_str, "string"),
+    ("org_type", 3, to_export_str, "string"),
+    ("created_at", 4, to_export_timestamp, "timestamp"),
+    # В одном столбце листа либо котировка, либо "Время вышло"/"Отказ от предоставления"
+    ("quote_pct", 5, to_export_float, "float64"),
+    ("status", 5, to_export_status, "string"),
+    ("metal", None, None, "string"),  # берётся из названия листа
+)
+
+def decode_export_row(values: list, columns: tuple) -> dict:
+    width = len(values)
+    return {
+        name: parse(values[index] if index < width else "")
+        for name, index, parse, _ in columns if parse
+    }
+
+async def stream_rows(sheet: GovernedSheet, start_row: int):
+    # Отдаёт строки листа порциями, не загружая лист целиком
+    while True:
+        end_row = start_row + EXPORT_CHUNK_ROWS - 1
+        chunk = await sheet.get_rows(start_row, end_row)
+        if not chunk:
+            return
+        yield start_row, chunk
+        if len(chunk) < EXPORT_CHUNK_ROWS:
+            return
+        start_row = end_row + 1
+
+class PartitionWriter:
+    # Дописывает строки в файлы секций металл/месяц; файлы открываются по мере появления секций.
+    # Пока выгрузка набора не завершена, файлы пишутся под временными именами: после сбоя
+    # в секциях не остаётся частичных файлов, которые следующая выгрузка продублировала бы.
+    def __init__(self, root: str, columns: tuple, stamp: str):
+        self.root = root
+        self.names = [name for name, _, _, _ in columns]
+        self.stamp = stamp
+        self.csv_files = {}
+        self.parquet_writers = {}
+        self.paths = []  # готовые имена файлов, временные получаются добавлением ".tmp"
+        self.schema = None
+        if pyarrow:
+            types_map = {
+                "int64": pyarrow.int64(),
+                "float64": pyarrow.float64(),
+                "string": pyarrow.string(),
+                "timestamp": pyarrow.timestamp("s"),
+            }
+            self.schema = pyarrow.schema([(name, types_map[kind]) for name, _, _, kind in columns])
+        self.rows_written = 0
+        self.max_created_at = None
+
+    def write(self, rows: list):
+        partitions = {}
+        for row in rows:
+            key = (METAL_SLUGS.get(row["metal"], "other"), row["created_at"].strftime("%Y-%m"))
+            partitions.setdefault(key, []).append(row)
+            if self.max_created_at is None or row["created_at"] > self.max_created_at:
+                self.max_created_at = row["created_at"]
+        for key, part in partitions.items():
+            self.partition_csv(key).writerows(
+                [row[name].isoformat(sep=" ") if isinstance(row[name], datetime) else row[name]
+                 for name in self.names]
+                for row in part
+            )
+            if self.schema is not None:
+                self.partition_parquet(key).write_table(pyarrow.Table.from_pylist(part, schema=self.schema))
+        self.rows_written += len(rows)
+
+    def partition_path(self, key: tuple, extension: str) -> str:
+        metal, month = key
+        folder = os.path.join(self.root, f"metal={metal}", f"month={month}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"part-{self.stamp}.{extension}")
+        self.paths.append(path)
+        return f"{path}.tmp"
+
+    def partition_csv(self, key: tuple):
+        if key not in self.csv_files:
+            f = open(self.partition_path(key, "csv"), "w", newline="", encoding="utf-8")
+            writer = csv.writer(f)
+            writer.writerow(self.names)
+            self.csv_files[key] = (f, writer)
+        return self.csv_files[key][1]
+
+    def partition_parquet(self, key: tuple):
+        if key not in self.parquet_writers:
+            self.parquet_writers[key] = pyarrow.parquet.ParquetWriter(self.partition_path(key, "parquet"), self.schema)
+        return self.parquet_writers[key]
+
+    def close(self, completed: bool):
+        # completed=False — выгрузка прервана, временные файлы удаляются
+        for f, _ in self.csv_files.values():
+            f.close()
+        for writer in self.parquet_writers.values():
+            writer.close()
+        for path in self.paths:
+            if completed:
+                os.replace(f"{path}.tmp", path)
+            else:
+                os.remove(f"{path}.tmp")
+
+def load_watermarks(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_watermarks(path: str, watermarks: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(watermarks, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def export_rows(writer: PartitionWriter, chunk: list, columns: tuple, last, metal: str = None):
+    rows = []
+    for values in chunk:
+        row = decode_export_row(values, columns)
+        if metal:
+            row["metal"] = metal
+        if row["created_at"] and (last is None or row["created_at"] > last):
+            rows.append(row)
+    writer.write(rows)
+
+async def offers_export_sheets(last) -> list:
+    # Архивы месяцев раньше отметки уже выгружены и не читаются
+    return await offers_partitions(last.date() if last else date.min, clock.now().date())
+
+async def export_history(out_dir: str, full: bool = False) -> dict:
+    t = tenant()
+    root = os.path.join(out_dir, t.name)
+    if full:
+        # Полная выгрузка заменяет прежние файлы, иначе строки в секциях задвоятся
+        for dataset in ("offers", "quotes"):
+            shutil.rmtree(os.path.join(root, dataset), ignore_errors=True)
+    os.makedirs(root, exist_ok=True)
+    watermarks_path = os.path.join(root, "watermarks.json")
+    watermarks = {} if full else load_watermarks(watermarks_path)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    exported = {}
+
+    mark = watermarks.get("offers", {})
+    last = datetime.fromisoformat(mark["last"]) if mark.get("last") else None
+    writer = PartitionWriter(os.path.join(root, "offers"), OFFER_EXPORT_COLUMNS, stamp)
+    completed = False
+    try:
+        for sheet in await offers_export_sheets(last):
+            async for _, chunk in stream_rows(sheet, 2):
+                export_rows(writer, chunk, OFFER_EXPORT_COLUMNS, last)
+        completed = True
+    finally:
+        writer.close(completed)
+    # Отметка сохраняется сразу после набора: при сбое на следующем наборе
+    # уже выгруженные строки не попадут в файлы повторно
+    if writer.max_created_at:
+        watermarks["offers"] = {"last": writer.max_created_at.isoformat()}
+        save_watermarks(watermarks_path, watermarks)
+    exported["offers"] = writer.rows_written
+
+    # Листы котировок только дописываются, поэтому кроме времени запоминается и номер строки
+    for metal, sheet in (("Золото", t.gold_sheet), ("Серебро", t.silver_sheet)):
+        dataset = f"quotes_{METAL_SLUGS[metal]}"
+        mark = watermarks.get(dataset, {})
+        last = datetime.fromisoformat(mark["last"]) if mark.get("last") else None
+        next_row = mark.get("next_row", 2)
+        writer = PartitionWriter(os.path.join(root, "quotes"), QUOTE_EXPORT_COLUMNS, stamp)
+        completed = False
+        try:
+            async for first_row, chunk in stream_rows(sheet, next_row):
+                export_rows(writer, chunk, QUOTE_EXPORT_COLUMNS, last, metal=metal)
+                next_row = first_row + len(chunk)
+            completed = True
+        finally:
+            writer.close(completed)
+        newest = writer.max_created_at or last
+        watermarks[dataset] = {"last": newest.isoformat() if newest else None, "next_row": next_row}
+        save_watermarks(watermarks_path, watermarks)
+        exported[dataset] = writer.rows_written
+    return exported
+
+def run_export_cli(argv: list):
+    parser = argparse.ArgumentParser(
+        prog="bot.py export",
+        description="Выгрузка предложений и котировок в CSV/Parquet по металлам и месяцам",
+    )
+    parser.add_argument("--out", default=EXPORT_DIR, help="папка для файлов выгрузки")
+    parser.add_argument("--desk", help="выгрузить только указанный стол из tenants.json")
+    parser.add_argument("--full", action="store_true", help="выгрузить всю историю, игнорируя отметки")
+    args = parser.parse_args(argv)
+    if not pyarrow:
+        logger.warning("pyarrow не установлен, выгрузка только в CSV")
+    asyncio.run(export_all(args.out, args.desk, args.full))
+
+async def export_all(out_dir: str, desk: str = None, full: bool = False):
+    sheets_quota.per_minute = EXPORT_SHEETS_QUOTA_PER_MINUTE
+    for t in await asyncio.to_thread(build_tenants):
+        if desk and t.name != desk:
+            continue
+        token = current_tenant.set(t)
+        try:
+            exported = await export_history(out_dir, full=full)
+            log_event("SYSTEM", None, f"Выгрузка [{t.name}] завершена | Строк: {exported}")
+        finally:
+            current_tenant.reset(token)
+
 async def on_startup(bot: Bot):
     await bot.delete_webhook(drop_pending_updates=True)
     logger.info("Вебхук удален, старые сообщения пропущены")
@@ -925,28 +2211,322 @@ async def on_startup(bot: Bot):
         with open("bot.log", "w") as f:
             f.write("")
     try:
-        test_data = users_sheet.get_all_records()
+        test_data = await tenant().users_view.get()
         log_event("SYSTEM", None, f"Подключение к Google Sheets успешно | Пользователей: {len(test_data)}")
     except Exception as e:
         log_event("ERROR", None, f"Ошибка доступа к Google Sheets: {e}")
+        log_event("SYSTEM", None, "Бот запущен, Google Sheets будут подключены при восстановлении доступа")
         return
     log_event("SYSTEM", None, "Бот успешно запущен")
 
+#  Контроль задержки event loop
+# Вызовы gspread выполняются в рабочих потоках (см. run_sheets), но любой другой
+# синхронный вызов может заблокировать event loop. Сторожевой поток замечает
+# блокировку, пока она длится, и логирует стек блокирующего вызова вместе с
+# обновлением или задачей планировщика, которая его сделала.
+class LoopWatchdog:
+    def __init__(self):
+        self.samples = collections.deque(maxlen=LAG_SAMPLES)
+        self.last_beat = monotonic()
+        self.loop = None
+        self.loop_thread_id = None
+        self.stall_reported = False
+
+    async def measure(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = monotonic()
+        threading.Thread(target=self.watch, name="loop-watchdog", daemon=True).start()
+        while True:
+            started = monotonic()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            now = monotonic()
+            self.samples.append(max(0.0, now - started - LAG_PROBE_INTERVAL))
+            self.last_beat = now
+            self.stall_reported = False
+
+    def stalled_for(self) -> float:
+        if self.loop is None:
+            return 0.0
+        return max(0.0, monotonic() - self.last_beat - LAG_PROBE_INTERVAL)
+
+    def watch(self):
+        # Выполняется в отдельном потоке и не зависит от состояния event loop
+        while True:
+            blocking_sleep(LAG_PROBE_INTERVAL / 5)
+            stalled = self.stalled_for()
+            if stalled < LAG_THRESHOLD or self.stall_reported:
+                continue
+            self.stall_reported = True
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "стек недоступен\n"
+            task = asyncio.current_task(self.loop)
+            activity = activity_labels.get(task) or (task.get_name() if task else "вне задач asyncio")
+            logger.warning(f"Event loop заблокирован уже {stalled:.2f} сек | {activity}\n{stack.rstrip()}")
+
+    def percentiles(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+        def pick(q):
+            return samples[min(len(samples) - 1, int(q * len(samples)))]
+        return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": samples[-1]}
+
+    def format_lag(self) -> str:
+        lag = self.percentiles()
+        return " ".join(f"{name}={value * 1000:.0f}мс" for name, value in lag.items())
+
+watchdog = LoopWatchdog()
+
+class HealthHandler(BaseHTTPRequestHandler):
+    # Отвечает из отдельного потока, поэтому работает даже при зависшем event loop
+    def do_GET(self):
+        stalled = watchdog.stalled_for()
+        lag = watchdog.percentiles()
+        if self.path == "/health/live":
+            ok = stalled < LIVE_MAX_STALL
+        elif self.path == "/health/ready":
+            ok = stalled < LAG_THRESHOLD and lag["p95"] < READY_MAX_LAG
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps({
+            "status": "ok" if ok else "fail",
+            "stalled_seconds": round(stalled, 3),
+            "loop_lag_seconds": {name: round(value, 4) for name, value in lag.items()},
+            "sheets": sheets_metrics(),
+        }, ensure_ascii=False).encode("utf-8")
+        self.send_response(200 if ok else 503)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_health_server():
+    if not HEALTH_PORT:
+        return
+    try:
+        server = ThreadingHTTPServer((HEALTH_HOST, HEALTH_PORT), HealthHandler)
+    except OSError as e:
+        # Занятый порт не должен мешать запуску бота
+        logger.error(f"Не удалось запустить проверку готовности на {HEALTH_HOST}:{HEALTH_PORT}: {e}")
+        return
+    threading.Thread(target=server.serve_forever, name="health-server", daemon=True).start()
+    logger.info(f"Проверка готовности доступна на {HEALTH_HOST}:{HEALTH_PORT}: /health/live, /health/ready")
+
+def format_sheets_metrics(only_problems: bool = False) -> str:
+    lines = []
+    for desk, sheets in sheets_metrics().items():
+        for title, m in sheets.items():
+            if only_problems and m["state"] == "closed" and not m["queued_writes"]:
+                continue
+            lines.append(
+                f"[{desk}] {title}: {m['state']} | ошибок подряд: {m['failures']} | повторов: {m['retries']} "
+                f"| чтений из кэша: {m['degraded_reads']} | отложенных записей: {m['queued_writes']}"
+            )
+    return "\n".join(lines)
+
 async def health_check():
     while True:
-        logger.info("Бот жив…")
+        logger.info(f"Бот жив… | Задержка event loop: {watchdog.format_lag()}")
+        if watchdog.percentiles()["p95"] >= READY_MAX_LAG:
+            logger.warning("Event loop систематически блокируется, бот отвечает с задержкой")
+        problems = format_sheets_metrics(only_problems=True)
+        if problems:
+            logger.warning(f"Состояние Google Sheets:\n{problems}")
         await asyncio.sleep(5 * 60)
 
+@dp.message(Command("sheets_status"))
+async def sheets_status_command(message: types.Message):
+    if message.from_user.id not in tenant().admin_ids:
+        return
+    await message.answer(format_sheets_metrics() or "Листы не подключены.", parse_mode=None)
+
+#  Симуляция торгового дня на виртуальных часах
+# Листы загружаются из CSV-файлов (<папка>/<название листа>.csv), запросы к Telegram
+# не отправляются, а запоминаются. Задачи планировщика и сроки ответа срабатывают
+# по виртуальному времени, поэтому сутки рассылок и таймаутов проходят за секунды.
+class MemoryWorksheet:
+    # Лист в памяти с теми методами gspread, которыми пользуется бот
+    def __init__(self, title: str, values: list):
+        self.title = title
+        self.values = values
+
+    def get_all_values(self, **kwargs) -> list:
+        return [list(row) for row in self.values]
+
+    def get_values(self, range_name: str, **kwargs) -> list:
+        start, end = (int(row) for row in re.findall(r"\d+", range_name))
+        return [list(row) for row in self.values[start - 1:end]]
+
+    def append_row(self, values: list, **kwargs):
+        self.values.append(["" if value is None else str(value) for value in values])
+
+    def append_rows(self, values: list, **kwargs):
+        for row in values:
+            self.append_row(row)
+
+    def delete_rows(self, start_index: int, end_index: int = None):
+        del self.values[start_index - 1:(end_index or start_index)]
+
+class MemorySpreadsheet:
+    def __init__(self, folder: str):
+        self.id = "simulation"
+        self.sheets = {}
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".csv"):
+                with open(os.path.join(folder, filename), newline="", encoding="utf-8") as f:
+                    title = filename[:-len(".csv")]
+                    self.sheets[title] = MemoryWorksheet(title, list(csv.reader(f)))
+
+    def get_lastUpdateTime(self) -> str:
+        return clock.now(pytz.utc).isoformat()
+
+    def worksheet(self, title: str) -> MemoryWorksheet:
+        if title not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def add_worksheet(self, title: str, rows: int, cols: int) -> MemoryWorksheet:
+        self.sheets[title] = MemoryWorksheet(title, [])
+        return self.sheets[title]
+
+    def worksheets(self) -> list:
+        return list(self.sheets.values())
+
+class MemoryClient:
+    def __init__(self, folder: str):
+        self.spreadsheet = MemorySpreadsheet(folder)
+
+    def open(self, name: str) -> MemorySpreadsheet:
+        return self.spreadsheet
+
+class SimulatedSession(BaseSession):
+    # Вместо Telegram API запоминает вызовы и отвечает локально собранными объектами
+    def __init__(self):
+        super().__init__()
+        self.calls = collections.Counter()
+        self.message_id = 0
+
+    async def make_request(self, bot: Bot, method, timeout: int = None):
+        self.calls[type(method).__name__] += 1
+        if method.__returning__ is types.Message:
+            self.message_id += 1
+            return types.Message(
+                message_id=self.message_id,
+                date=clock.now(pytz.utc),
+                chat=types.Chat(id=int(method.chat_id), type="private"),
+            )
+        return True
+
+    async def stream_content(self, url: str, headers: dict = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True):
+        # Бот не скачивает файлы из Telegram, в симуляции поток всегда пустой
+        for chunk in ():
+            yield chunk
+
+    async def close(self):
+        pass
+
+async def run_simulation(fixtures: str, first_day: date, days: int, out_dir: str) -> dict:
+    global clock, gc, sheets_in_threads
+    clock = VirtualClock(datetime.combine(first_day, time(0, 0)))
+    gc = MemoryClient(fixtures)
+    sheets_quota.per_minute = None
+    sheets_in_threads = False  # листы в памяти, а ответ из потока нарушил бы порядок виртуального времени
+    session = SimulatedSession()
+    t = Tenant(name="simulation", token="1:SIMULATION", sheet_name="simulation",
+               group_chat_id=chat_id, admin_ids=[], session=session)
+    tenants.append(t)
+    tenants_by_bot_id[t.bot.id] = t
+    token = current_tenant.set(t)
+    try:
+        jobs = [(trigger, job) for trigger, job, simulated in scheduled_jobs() if simulated]
+        end = clock.now(MSK_TZ) + timedelta(days=days)
+        fire_times = [trigger.get_next_fire_time(None, clock.now(MSK_TZ)) for trigger, _ in jobs]
+        runs = collections.Counter()
+        started = monotonic()
+        while True:
+            index = min(range(len(jobs)), key=lambda i: fire_times[i])
+            fire_at = fire_times[index]
+            if fire_at >= end:
+                break
+            await clock.advance_to(fire_at)
+            trigger, job = jobs[index]
+            await job()
+            await clock.settle()
+            runs[job.__name__] += 1
+            fire_times[index] = trigger.get_next_fire_time(fire_at, fire_at + timedelta(seconds=1))
+        await clock.advance_to(end)
+        elapsed = monotonic() - started
+    finally:
+        current_tenant.reset(token)
+    os.makedirs(out_dir, exist_ok=True)
+    for title, sheet in gc.spreadsheet.sheets.items():
+        with open(os.path.join(out_dir, f"{title}.csv"), "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(sheet.values)
+    summary = {
+        "virtual_start": datetime.combine(first_day, time(0, 0)).isoformat(),
+        "virtual_days": days,
+        "wall_seconds": round(elapsed, 3),
+        "job_runs": dict(runs),
+        "telegram_calls": dict(session.calls),
+        "sheet_rows": {title: max(0, len(sheet.values) - 1) for title, sheet in gc.spreadsheet.sheets.items()},
+        "pending_timers": len(t.active_timers),
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+def run_simulation_cli(argv: list):
+    parser = argparse.ArgumentParser(
+        prog="bot.py simulate",
+        description="Прогон рассылок и таймаутов на виртуальных часах по листам из CSV",
+    )
+    parser.add_argument("--fixtures", required=True, help="папка с CSV-файлами листов")
+    parser.add_argument("--date", required=True, help="первый день симуляции, ГГГГ-ММ-ДД")
+    parser.add_argument("--days", type=int, default=1, help="сколько суток проиграть")
+    parser.add_argument("--out", default="simulation", help="папка для итоговых листов и summary.json")
+    args = parser.parse_args(argv)
+    first_day = datetime.strptime(args.date, "%Y-%m-%d").date()
+    summary = asyncio.run(run_simulation(args.fixtures, first_day, args.days, args.out))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+def scheduled_jobs() -> list:
+    # (триггер, задача, выполняется ли в симуляции) — общий список для планировщика и симуляции
+    return [
+        (CronTrigger(minute="*", timezone=MSK_TZ), send_scheduled_notifications, True),
+        (CronTrigger(hour=0, minute=5, timezone=MSK_TZ), rollover_offers, True),
+        (IntervalTrigger(seconds=CHANGES_POLL_SECONDS), poll_sheet_changes, False),
+        (IntervalTrigger(seconds=WRITES_FLUSH_SECONDS), flush_sheet_writes, False),
+    ]
+
 async def main():
-    await on_startup(bot)
+    asyncio.create_task(watchdog.measure(), name="loop-watchdog")
+    start_health_server()
+    await asyncio.to_thread(build_tenants)
+    for t in tenants:
+        token = current_tenant.set(t)
+        try:
+            await on_startup(t.bot)
+            await rollover_offers()
+        finally:
+            current_tenant.reset(token)
     asyncio.create_task(health_check())
     scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
-    scheduler.add_job(
-        send_scheduled_notifications,
-        trigger=CronTrigger(minute="*"),
-    )
+    for t in tenants:
+        for trigger, job, _ in scheduled_jobs():
+            scheduler.add_job(run_as_tenant, trigger=trigger, args=[t, job])
     scheduler.start()
-    await dp.start_polling(bot, skip_updates=True)
+    await dp.start_polling(*[t.bot for t in tenants], skip_updates=True)
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        run_export_cli(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "simulate":
+        run_simulation_cli(sys.argv[2:])
+    else:
+        asyncio.run(main())
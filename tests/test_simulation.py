@@ -0,0 +1,36 @@
+import asyncio
+import json
+import os
+import sys
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures", "simulation")
+sys.path.insert(0, ROOT)
+
+
+def test_simulated_trading_day(tmp_path, monkeypatch):
+    # bot.py пишет bot.log в текущую папку при импорте
+    monkeypatch.chdir(tmp_path)
+    import bot
+
+    out_dir = tmp_path / "out"
+    # Четверг 02.10.2025: рабочий день, запрос котировок в 10:00 и текст для банков в 11:00
+    summary = asyncio.run(bot.run_simulation(FIXTURES, date(2025, 10, 2), 1, str(out_dir)))
+
+    assert summary["job_runs"] == {"send_scheduled_notifications": 1440, "rollover_offers": 1}
+    # 2 запроса котировок, 2 сообщения о таймауте, 1 текст; по 2 снятия клавиатуры на таймаут
+    assert summary["telegram_calls"] == {"SendMessage": 5, "EditMessageReplyMarkup": 4}
+    assert summary["sheet_rows"] == {
+        "Запрос": 2,
+        "Золото": 2,
+        "Настройки": 1,
+        "Пользователи": 3,
+        "Предложения о покупке": 0,
+        "Серебро": 2,
+        "Предложения о покупке 2025-09": 1,
+        "Предложения о покупке 2025-10": 1,
+    }
+    assert summary["pending_timers"] == 0
+    with open(out_dir / "summary.json", encoding="utf-8") as f:
+        assert json.load(f)["sheet_rows"] == summary["sheet_rows"]